@@ -1,10 +1,47 @@
 import concurrent.futures
+import functools
 import os
+import shutil
 import subprocess
+import tempfile
 from pathlib import Path
 
 import numpy as np
 import pandas as pd
+import pyarrow as pa
+from pyarrow import csv as pa_csv
+
+rng = np.random.default_rng()
+# Buffer size for writing model files, large enough to hold any of them whole
+WRITE_BUFFER_SIZE = 1 << 16
+
+
+@functools.lru_cache(maxsize=32)
+def _read_file_lines(path: str, mtime_ns: int, size: int) -> tuple[str, ...]:
+    """
+    Read the lines of a file.
+    Cached on modification time and size so that a changed file is read again.
+    """
+    return tuple(Path(path).read_text().splitlines())
+
+
+def _reflect(
+    simplx: np.ndarray,
+    param_idx: np.ndarray,
+    mins: np.ndarray,
+    maxs: np.ndarray,
+    reflection_coef: float,
+) -> tuple[np.ndarray, np.ndarray, bool]:
+    """
+    Reflect the worst point of a sorted simplex through the centroid of the others.
+    Returns the centroid, the reflected point and whether the reflected point's
+    parameters (columns param_idx) lie within mins and maxs.
+    """
+    centroid = simplx[:-1].mean(axis=0)
+    new = centroid + reflection_coef * (centroid - simplx[-1])
+    vals = new[param_idx]
+    return centroid, new, bool(((vals >= mins) & (vals <= maxs)).all())
+
 
 # TODO add logging functionality to calibration
 # TODO maybe switch from evaluation mode to exclusive calibration mode for performance
@@ -18,24 +55,94 @@ class AquiModAWS:
         self.input_path = Path(model_dir, "Input.txt")
         self.observations_path = Path(model_dir, "Observations.txt")
         self._model_data = pd.read_csv("model_data.csv")
+        # Input file is read once and kept in memory; setters keep it in sync
+        self._input_lines = self.input_path.read_text().splitlines()
+        self._input_dirty = False
+        # Lookup tables built once so that properties avoid re-filtering the table
+        # component -> {module_number: module_name}
+        self._component_modules = {
+            component: dict(zip(df["module_number"], df["module_name"]))
+            for component, df in self._model_data.groupby("component")
+        }
+        # module_name -> [parameter, ...] (in calibration file order)
+        self._module_params = {
+            module_name: df["parameter"].to_list()
+            for module_name, df in self._model_data.groupby("module_name", sort=False)
+        }
+        # Column types of AquiMod tables are declared up front so that reading them
+        # skips type inference. AquiMod writes failed runs as "-nan(ind)".
+        column_types = {
+            parameter: pa.float64() for parameter in self._model_data["parameter"]
+        }
+        column_types["ObjectiveFunction"] = pa.float64()
+        self._convert_options = pa_csv.ConvertOptions(
+            column_types=column_types,
+            null_values=["-nan(ind)", "nan", "-nan", "NaN", ""],
+        )
+        # (module_name, parameter) -> line_number
+        self._param_lines = {
+            (module_name, parameter): int(line_number)
+            for module_name, parameter, line_number in self._model_data[
+                ["module_name", "parameter", "line_number"]
+            ].itertuples(index=False)
+        }
 
     def _edit_line(self, path, line_number: int, text: str):
-        """Edit a text file at a certain line. Automatically places newline char."""
-        with open(path, "r") as f:
-            lines = f.readlines()
-            lines[line_number] = text + "\n"
-        with open(self.input_path, "w") as f:
-            f.writelines(lines)
+        """
+        Edit a text file at a certain line. Automatically places newline char.
+        Edits to the input file are buffered until self._flush_input() is called.
+        """
+        if Path(path) == self.input_path:
+            self._input_lines[line_number] = text
+            self._input_dirty = True
+            return
+        lines = list(self._read_lines(path))
+        lines[line_number] = text
+        with open(path, "w", buffering=WRITE_BUFFER_SIZE) as f:
+            f.write("\n".join(lines) + "\n")
+        # A quick rewrite may keep the same modification time
+        _read_file_lines.cache_clear()
+
+    def _flush_input(self):
+        """Write any buffered edits to the input file in a single write"""
+        if not self._input_dirty:
+            return
+        with open(self.input_path, "w", buffering=WRITE_BUFFER_SIZE) as f:
+            f.write("\n".join(self._input_lines) + "\n")
+        self._input_dirty = False
 
     def _read_line(self, path, line_number: int) -> str:
         """Read contents of a certain line within a file"""
-        with open(path, "r") as f:
-            lines = f.readlines()
-        return lines[line_number].replace("\n", "")
+        if Path(path) == self.input_path:
+            return self._input_lines[line_number]
+        return self._read_lines(path)[line_number]
+
+    def _read_lines(self, path) -> tuple[str, ...]:
+        """Read all lines of a file, reusing the last read if it hasn't changed"""
+        stat = os.stat(path)
+        return _read_file_lines(str(path), stat.st_mtime_ns, stat.st_size)
 
     def _read_data(self, path, skiprows=None) -> pd.DataFrame:
         """Read AquiMod data in a table format"""
-        return pd.read_csv(path, sep="\t", index_col=False, skiprows=skiprows)
+        if skiprows is not None:
+            return pd.read_csv(path, sep="\t", index_col=False, skiprows=skiprows)
+        with open(path, "r") as f:
+            header = f.readline().rstrip("\n").split("\t")
+            # AquiMod ends each data row with a delimiter, which adds an empty column
+            trailing_delimiter = f.readline().rstrip("\n").endswith("\t")
+        column_names = header + [""] if trailing_delimiter else header
+        table = pa_csv.read_csv(
+            path,
+            read_options=pa_csv.ReadOptions(skip_rows=1, column_names=column_names),
+            parse_options=pa_csv.ParseOptions(delimiter="\t"),
+            convert_options=self._convert_options,
+        )
+        return table.select(header).to_pandas(self_destruct=True)
+
+    def _clear_cached(self, *names: str):
+        """Clear cached properties so that they are recomputed on next access"""
+        for name in names:
+            self.__dict__.pop(name, None)
 
     def _delete_dir_contents(self, directory):
         """Delete contents"""
@@ -57,6 +164,16 @@ class AquiModAWS:
         """Set module numbers in input file"""
         text = " ".join([str(val) for val in config])
         self._edit_line(self.input_path, 1, text)
+        self._clear_cached(
+            "module_names",
+            "parameters",
+            "parameter_line_numbers",
+            "calibration_paths",
+            "evaluation_paths",
+            "output_calibration_paths",
+            "output_evaluation_paths",
+            "parameter_bounds",
+        )
 
     @property
     def simulation_mode(self) -> str:
@@ -77,6 +194,7 @@ class AquiModAWS:
     def number_of_runs(self, num_runs: int):
         """Set number of runs in input file"""
         self._edit_line(self.input_path, 10, str(num_runs))
+        self._clear_cached("output_evaluation_paths")
 
     @property
     def calibrated_variable(self) -> str:
@@ -87,6 +205,7 @@ class AquiModAWS:
     def calibrated_variable(self, variable: str):
         """Set calibrated variable (either 'g' or 's') in input file"""
         self._edit_line(self.input_path, 7, variable)
+        self._clear_cached("output_calibration_paths", "output_evaluation_paths")
 
     @property
     def performance_threshold(self) -> int:
@@ -96,7 +215,7 @@ class AquiModAWS:
     @performance_threshold.setter
     def performance_threshold(self, threshold: float):
         """Set acceptable model threshold in input file"""
-        self._edit_line(self.input_path, 19, threshold)
+        self._edit_line(self.input_path, 19, str(threshold))
 
     @property
     def write_outputs(self) -> list[str]:
@@ -107,76 +226,32 @@ class AquiModAWS:
     def write_outputs(self, write_outputs: list[str]):
         self._edit_line(self.input_path, 25, " ".join(write_outputs))
 
-    @property
+    @functools.cached_property
     def module_names(self) -> dict[str, str]:
         """Get module names"""
-        # df_dict = {
-        #     "soil": self._model_data[self._model_data["component"] == "soil"],
-        #     "unsaturated": self._model_data[
-        #         self._model_data["component"] == "unsaturated"
-        #     ],
-        #     "saturated": self._model_data[self._model_data["component"] == "saturated"],
-        # }
-        # modules = self.module_config
-
-        # return {
-        #     component: df[
-        #         df["module_number"] == modules[component], "module_name"
-        #     ].unique()[0]
-        #     for component, df in df_dict.items()
-        # }
-        output = {}
-        for component, module_number in self.module_config.items():
-            df = self._model_data[self._model_data["component"] == component]
-            df = df[df["module_number"] == module_number]
-            df = df.reset_index(drop=True)
-            output[component] = df.loc[0, "module_name"]
-
-        return output
+        return {
+            component: self._component_modules[component][module_number]
+            for component, module_number in self.module_config.items()
+        }
 
-    @property
+    @functools.cached_property
     def parameters(self) -> dict[str, list[str]]:
         """Get parameter names as list value for each parameter key"""
-        # return {
-        #     module_name: list(
-        #         self._model_data[
-        #             self._model_data["module_name"] == module_name, "component_name"
-        #         ].unique()
-        #     )
-        #     for module_name in self.module_names.values()
-        # }
-
-        output = {}
-        for module_name in self.module_names.values():
-            df = self._model_data[self._model_data["module_name"] == module_name]
-            output[module_name] = df["parameter"].to_list()
-        return output
+        return {
+            module_name: self._module_params[module_name]
+            for module_name in self.module_names.values()
+        }
 
-    @property
+    @functools.cached_property
     def parameter_line_numbers(self) -> dict[str, int]:
         """Get parameter line numbers as a dictionary with parameter as key"""
-        # return {
-        #     parameter: self._model_data[
-        #         (self._model_data["module_name"] == module)
-        #         & (self._model_data["parameter"] == parameter),
-        #         "line_number",
-        #     ].unique()[0]
-        #     for module, parameter in self.parameters.items()
-        # }
-
-        output = {}
-        for module, parameter_list in self.parameters.items():
-            for parameter in parameter_list:
-                # df = self._model_data
-                # df = df[(df["module_name"] == module) & (df["parameter"] == parameter)]
-                # df = df.reset_index(drop=True)
-                # output[parameter] = df.loc[0, "line_number"]
-
-                df = self._model_data.set_index(["module_name", "parameter"])
-                output[parameter] = df.loc[(module, parameter), "line_number"]
-        return output
+        return {
+            parameter: self._param_lines[(module, parameter)]
+            for module, parameter_list in self.parameters.items()
+            for parameter in parameter_list
+        }
 
-    @property
+    @functools.cached_property
     def calibration_paths(self) -> dict[str, Path]:
         """Get paths to calibration files"""
         return {
@@ -184,7 +259,7 @@ class AquiModAWS:
             for component, module_name in self.module_names.items()
         }
 
-    @property
+    @functools.cached_property
     def evaluation_paths(self) -> dict[str, Path]:
         """Get paths to evaluation files"""
         return {
@@ -192,7 +267,7 @@ class AquiModAWS:
             for component, module_name in self.module_names.items()
         }
 
-    @property
+    @functools.cached_property
     def output_calibration_paths(self) -> dict[str, Path]:
         """Get the paths to output calibration files"""
         paths = {
@@ -206,8 +281,8 @@ class AquiModAWS:
 
         return paths
 
-    @property
-    def output_evaluation_paths(self) -> dict[str, list[Path]]:
+    @functools.cached_property
+    def output_evaluation_paths(self) -> dict[str, tuple[Path, ...]]:
         """Get the paths to output evaluation files"""
         # Could search for paths using path.glob or use the number of runs property
         # Opted for using the number of runs property
@@ -215,11 +290,10 @@ class AquiModAWS:
         # For now assume that everything is saved
         path_dict = {}
         for component, module in self.module_names.items():
-            path_list = [
+            path_dict[component] = tuple(
                 Path(self.model_dir, "Output", module + f"_TimeSeries{i}.out")
                 for i in range(1, self.number_of_runs + 1)
-            ]
-            path_dict[component] = path_list
+            )
 
         if self.calibrated_variable == "g":
             path_dict["fit"] = Path(self.model_dir, "Output", "fit_eval_GWL.out")
@@ -234,31 +308,66 @@ class AquiModAWS:
         Get parameter limits as dict of dataframes.
         Dataframes arranged with parameters as columns.
         """
-        # Instantiate outer dictionary
+        mins, maxs, _ = self.parameter_bounds
         outer = {}
-        # Loop through each component and its calibration file path
-        for component, path in self.calibration_paths.items():
-            # Instantiate inner dictionary
-            inner = {}
-            # Loop through each parameter in the current component
-            module = self.module_names[component]
-            for parameter in self.parameters[module]:
-                # Get min and max value for each parameter as string
-                minmax = self._read_line(path, self.parameter_line_numbers[parameter])
-                # Split string into list and cast elements into floats
-                minmax_list = [float(val) for val in minmax.split(" ")]
-                # Assign list of min and max floats to inner dictionary
-                inner[parameter] = minmax_list
-            # Convert inner dictionary to DataFrame and assign to outer dictionary
-            outer[component] = pd.DataFrame(inner, index=["min", "max"])
+        start = 0
+        for component, module in self.module_names.items():
+            parameters = self.parameters[module]
+            stop = start + len(parameters)
+            outer[component] = pd.DataFrame(
+                [mins[start:stop], maxs[start:stop]],
+                index=["min", "max"],
+                columns=parameters,
+            )
+            start = stop
 
         return outer
 
     @calibration_parameters.setter
     def calibration_parameters(self, calib_dict: dict[str, pd.DataFrame]) -> None:
-        """Set calibration parameters"""
-        # Don't think I need to work on this one right now
-        pass
+        """Set parameter limits in calibration files"""
+        for component, df in calib_dict.items():
+            if component == "fit":
+                continue
+            path = self.calibration_paths[component]
+            lines = list(self._read_lines(path))
+            for parameter in df.columns:
+                minimum = df.loc["min", parameter]
+                maximum = df.loc["max", parameter]
+                lines[self.parameter_line_numbers[parameter]] = f"{minimum} {maximum}"
+            with open(path, "w", buffering=WRITE_BUFFER_SIZE) as f:
+                f.write("\n".join(lines) + "\n")
+        # A quick rewrite may keep the same modification time
+        _read_file_lines.cache_clear()
+        self._clear_cached("parameter_bounds")
+
+    @functools.cached_property
+    def parameter_bounds(self) -> tuple[np.ndarray, np.ndarray, list[str]]:
+        """
+        Get parameter limits as arrays of minimums and maximums.
+        Also returns the parameter names in the same order as the arrays.
+        """
+        parameters = []
+        minmax_lines = []
+        # Read each calibration file once and pick out the lines of its parameters
+        for component, path in self.calibration_paths.items():
+            lines = self._read_lines(path)
+            for parameter in self.parameters[self.module_names[component]]:
+                parameters.append(parameter)
+                minmax_lines.append(lines[self.parameter_line_numbers[parameter]])
+        # Parse each line separately so that a malformed line can't shift values
+        # into the limits of the next parameter
+        minmax = [
+            np.fromstring(line, dtype=np.float64, sep=" ") for line in minmax_lines
+        ]
+        for parameter, values in zip(parameters, minmax):
+            if values.shape != (2,):
+                raise ValueError(
+                    f"Expected a min and max value for {parameter}, got {values}"
+                )
+        minmax = np.array(minmax).reshape(len(parameters), 2)
+
+        return minmax[:, 0].copy(), minmax[:, 1].copy(), parameters
 
     @property
     def evaluation_parameters(self) -> dict[str, pd.DataFrame]:
@@ -274,7 +383,14 @@ class AquiModAWS:
         for component, df in eval_dict.items():
             if component == "fit":
                 continue
-            df.to_csv(self.evaluation_paths[component], sep="\t", index=False)
+            # Format the whole table up front so that it's written in a single call
+            lines = ["\t".join(df.columns)]
+            for row in df.itertuples(index=False):
+                # Missing values are left empty, as DataFrame.to_csv writes them
+                lines.append("\t".join("" if pd.isna(v) else str(v) for v in row))
+            path = self.evaluation_paths[component]
+            with open(path, "w", buffering=WRITE_BUFFER_SIZE) as f:
+                f.write("\n".join(lines) + "\n")
 
     def run(
         self,
@@ -294,13 +410,10 @@ class AquiModAWS:
             self.number_of_runs = num_runs
         if write_outputs is not None:
             self.write_outputs = write_outputs
+        self._flush_input()
 
         self._delete_dir_contents(Path(self.model_dir, "Output"))
-        # os.system(f"AquiModAWS {self.model_dir}")
-
-        subprocess.run(
-            f"AquiModAWS {self.model_dir}", shell=True, stdout=subprocess.DEVNULL
-        )
+        subprocess.run(["AquiModAWS", str(self.model_dir)], stdout=subprocess.DEVNULL)
 
     def read_performance_output(self) -> dict[str, pd.DataFrame]:
         """
@@ -321,15 +434,12 @@ class AquiModAWS:
                 component: self._read_data(path)
                 for component, path in self.evaluation_paths.items()
             }
-            output["fit"] = pd.read_csv(
-                self.output_evaluation_paths["fit"], sep="\t", index_col=False
-            )
+            output["fit"] = self._read_data(self.output_evaluation_paths["fit"])
 
-        if (
-            len(output["fit"]) > 0
-            and output["fit"].loc[0, "ObjectiveFunction"] == "-nan(ind)"
-        ):
-            output["fit"].loc[0, "ObjectiveFunction"] == self.performance_threshold
+        # "-nan(ind)" is read as NaN
+        fit = output["fit"]
+        if len(fit) > 0 and pd.isna(fit.loc[0, "ObjectiveFunction"]):
+            fit.loc[0, "ObjectiveFunction"] = float(self.performance_threshold)
 
         return output
 
@@ -344,12 +454,14 @@ class AquiModAWS:
         alpha: int,
         reflection_coef=1,
         contraction_coef=0.5,
+        generator: np.random.Generator = None,
     ) -> dict[str, pd.DataFrame]:
         """
         q: number of points in simplex [2 <= q <= m]
         m: number of points in complex
         alpha: user-defined number of evolution iterations per simplex [alpha >= 1]
         beta: [beta >= 1]
+        generator: random generator for simplex selection (module rng by default)
 
         1. Assign weights to each point in the complex
         2. Randomly select weighted simplex points
@@ -380,45 +492,75 @@ class AquiModAWS:
         # I could also save the complx keys and df column names as a mapping
         # and then use the mapping to recreate the separate dictionary entries
 
-        # Convert complx from dictionary to a single dataframe
-        complx_df = pd.concat(complx.values(), axis=1)
+        # Flatten complx into a single array with a fixed column order
+        # Each component maps to a slice of columns so points can be split back up
+        components = list(complx)
+        columns = {component: list(df.columns) for component, df in complx.items()}
+        slices = {}
+        start = 0
+        for component in components:
+            slices[component] = slice(start, start + len(columns[component]))
+            start += len(columns[component])
+        all_columns = [col for component in components for col in columns[component]]
+        obj = all_columns.index("ObjectiveFunction")
+        complx_arr = np.hstack(
+            [complx[component].to_numpy(dtype=np.float64) for component in components]
+        )
+
+        def split(point: np.ndarray) -> dict[str, pd.DataFrame]:
+            """Split a flat point back into a dataframe for each component"""
+            return {
+                component: pd.DataFrame([point[slices[component]]], columns=cols)
+                for component, cols in columns.items()
+            }
+
+        # Buffer that each AquiMod result is read into
+        new_buf = np.empty(len(all_columns), dtype=np.float64)
+
+        def fill_from_outputs(buf: np.ndarray) -> bool:
+            """
+            Fill buf with the point from the most recent AquiMod run.
+            Returns False if any output doesn't contain exactly one row.
+            """
+            for component, df in self.read_performance_output().items():
+                if len(df) != 1:
+                    return False
+                buf[slices[component]] = df[columns[component]].to_numpy()[0]
+            return True
+
+        def read_point() -> np.ndarray:
+            """Read the point from the most recent AquiMod run into new_buf"""
+            # This is in case AquiModAWS malfunctions and needs to be rerun
+            while not fill_from_outputs(new_buf):
+                # If malfunction, perform mutation
+                self.run(sim_mode="c", num_runs=1, write_outputs=["Y", "Y", "Y"])
+            return new_buf
 
-        m = len(complx_df)
+        m = len(complx_arr)
         # 1. Calculate triangular distribution
         # Make sure that complx is ordered by ObjectiveFunction
-        complx_df = complx_df.sort_values("ObjectiveFunction", ascending=False)
-        complx_df = complx_df.reset_index(drop=True)
-        complx_df["weight"] = (2 * (m - complx_df.index.to_frame())) / (m * (m + 1))
-        # Normalise weights so that their sum == 1
-        complx_df["weight"] /= complx_df["weight"].sum()
+        complx_arr = complx_arr[np.argsort(-complx_arr[:, obj], kind="stable")]
+        # Rank 1 is the best point, weights sum to 1 by construction
+        ranks = np.arange(1, m + 1)
+        weight = 2 * (m + 1 - ranks) / (m * (m + 1))
         # 2. Select simplx points from weighted complx points
-        simplx = complx_df.loc[
-            np.random.choice(
-                complx_df.index, simplx_size, replace=False, p=complx_df["weight"]
-            )
-        ]
-        simplx = simplx.drop("weight", axis=1)
+        if generator is None:
+            generator = rng
+        simplx_idx = generator.choice(m, simplx_size, replace=False, p=weight)
+        simplx = complx_arr[simplx_idx]
+        # Parameter bounds are invariant across iterations
+        mins, maxs, parameters = self.parameter_bounds
+        param_idx = np.array([all_columns.index(col) for col in parameters])
         for _ in range(alpha):
             # 3. Restore order to simplx
-            simplx = simplx.sort_values("ObjectiveFunction", ascending=False)
-            # 4. Compute centroid of simplx
-            centroid = simplx.mean().to_frame().T
-            # Drop weight and ObjectiveFunction value of centroid
-            # centroid = centroid.drop(["ObjectiveFunction", "weight"], axis=1)
-            # 5. Perform reflection step of the worst performing point through centroid
-            worst = simplx.iloc[-1].to_frame().T
-            worst = worst.reset_index(drop=True)
-            new = centroid + reflection_coef * (centroid - worst)
-            new = new.reset_index(drop=True)  # is this necessary? yes
-            # 6. Check that the new point is still within parameter space
-            # Get parameter bounds
-            parameter_lims = pd.concat(self.calibration_parameters.values(), axis=1)
-            within_parameter_space = True
-            for col in parameter_lims.columns:
-                minimum = parameter_lims.loc["min", col]
-                maximum = parameter_lims.loc["max", col]
-                if not minimum <= new.loc[0, col] <= maximum:
-                    within_parameter_space = False
+            order = np.argsort(-simplx[:, obj], kind="stable")
+            simplx = simplx[order]
+            simplx_idx = simplx_idx[order]
+            # 4. - 6. Reflect worst point through centroid and check parameter space
+            worst = simplx[-1]
+            centroid, new, within_parameter_space = _reflect(
+                simplx, param_idx, mins, maxs, reflection_coef
+            )
             # 7. If new point is outside parameter space, perform mutation instead
             if not within_parameter_space:
                 # Mutation performed nut labelled as reflection
@@ -431,42 +573,32 @@ class AquiModAWS:
                 # Run AquiMod using the new point
                 # AquiMod must be run in evaluation mode for this
                 # Evaluation files need to be written for each module
-                # Need to separate new into components
-                eval_params = {
-                    component: new[df.columns] for component, df in complx.items()
-                }
-
-                self.evaluation_parameters = eval_params
+                self.evaluation_parameters = split(new)
                 self.run(sim_mode="e", num_runs=1, write_outputs=["N", "N", "N"])
-            new = pd.concat(self.read_performance_output().values(), axis=1)
-            # This is in case AquiModAWS malfunctions and needs to be rerun
-            while len(new) != 1:
-                # If malfunction, perform mutation
-                self.run(sim_mode="c", num_runs=1, write_outputs=["Y", "Y", "Y"])
-                new = pd.concat(self.read_performance_output().values(), axis=1)
+            new = read_point()
             # 9. Check if new point performs worse than worst point
-            if new.loc[0, "ObjectiveFunction"] < worst.loc[0, "ObjectiveFunction"]:
+            if new[obj] < worst[obj]:
                 # 10. Contract the worst performing point towards the centroid
                 new = worst + contraction_coef * (centroid - worst)
-                eval_params = {
-                    component: new[df.columns] for component, df in complx.items()
-                }
-                self.evaluation_parameters = eval_params
+                self.evaluation_parameters = split(new)
                 # 11. Run AquiMod for new point
                 self.run(sim_mode="e", num_runs=1, write_outputs=["N", "N", "N"])
-                new = pd.concat(self.read_performance_output().values(), axis=1)
+                new = read_point()
             # 12. Check if new point performs worse than the worst point
-            if new.loc[0, "ObjectiveFunction"] < worst.loc[0, "ObjectiveFunction"]:
+            if new[obj] < worst[obj]:
                 # 13. Generate random point within parameter space
                 # 14. Run AquiMod for new point
                 self.run(sim_mode="c", num_runs=1, write_outputs=["Y", "Y", "Y"])
-                new = pd.concat(self.read_performance_output().values(), axis=1)
+                new = read_point()
             # 15. Replace worst performing point with new point in simplx
-            simplx.iloc[-1] = new
+            simplx[-1] = new
 
-        complx_df.loc[simplx.index] = simplx
+        complx_arr[simplx_idx] = simplx
 
-        return {component: complx_df[df.columns] for component, df in complx.items()}
+        return {
+            component: pd.DataFrame(complx_arr[:, slices[component]], columns=cols)
+            for component, cols in columns.items()
+        }
 
     def calibrate(
         self,
@@ -508,55 +640,65 @@ class AquiModAWS:
         population = self.read_performance_output()
         population_df = pd.concat(population.values(), axis=1)
         best_performers: list[pd.DataFrame] = []
-        for i in range(num_cycles):
-            print(f"CYCLE {i + 1}: STARTED")
-            # 3. Partition into complexes
-            complxes: list[pd.DataFrame] = []
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            # Each complex evolves in its own copy of the model directory so that
+            # AquiMod runs for different complexes don't overwrite each other's files
+            workers: list[AquiModAWS] = []
             for j in range(num_complxes):
-                # Create a boolean mask to select rows of the i-th complex
-                bool_mask = [(k % num_complxes) == j for k in range(len(population_df))]
-                complx_df = population_df.loc[bool_mask]
-                complx = {
-                    component: complx_df[df.columns]
-                    for component, df in population.items()
-                }
-
-            ### Attempted to parallelise complxes here but it didn't work because each
-            ### process requires its own directory of "model"
-            #     complxes.append(complx)
-            # with concurrent.futures.ProcessPoolExecutor() as executor:
-            #     future_list = [
-            #         executor.submit(
-            #             self._cce, complx=complx, simplx_size=simplx_size, alpha=alpha
-            #         )
-            #         for complx in complxes
-            #     ]
-            #     complxes = []
-            #     for j, future in enumerate(future_list):
-            #         result = future.result()
-            #         df = pd.concat(result.values(), axis=1)
-            #         complxes.append(df)
-            #         print(f"\tCOMPLEX {j + 1}: {df['ObjectiveFunction'].max()}")
-
-                # 4. Implement CCE algorithm here
-                complx = self._cce(complx, simplx_size, alpha)
-                complxes.append(pd.concat(complx.values(), axis=1))
-                print(f"\tCOMPLEX {j + 1}: {complx['fit']['ObjectiveFunction'].max()}")
-
-            # Shuffle complxes back together
-            population_df = pd.concat(complxes)
-            population_df = population_df.sort_values(
-                "ObjectiveFunction", ascending=False
-            )
-            population_df = population_df.reset_index(drop=True)
-            best_performers.append(population_df.loc[0, "ObjectiveFunction"])
-            print(f"\tBEST: {best_performers[-1]}")
-            print(f"\tPOPULATION MEAN: {population_df['ObjectiveFunction'].mean()}")
-            print(f"CYCLE {i + 1}: COMPLETED\n")
-            # if len(best_performers) < 10:
-            #     continue
-            # if (best_performers[-1] / best_performers[-10]) < 1.001:
-            #     break
+                worker_dir = Path(tmp_dir, f"complx_{j + 1}")
+                shutil.copytree(self.model_dir, worker_dir)
+                workers.append(AquiModAWS(worker_dir))
+
+            with concurrent.futures.ProcessPoolExecutor(num_complxes) as executor:
+                for i in range(num_cycles):
+                    print(f"CYCLE {i + 1}: STARTED")
+                    # 3. Partition into complexes
+                    future_list = []
+                    # Worker processes each need an independent random stream
+                    generators = rng.spawn(num_complxes)
+                    for j, worker in enumerate(workers):
+                        # Every num_complxes-th row starting at j forms the j-th complex
+                        complx_df = population_df.iloc[j::num_complxes]
+                        complx = {
+                            component: complx_df[df.columns]
+                            for component, df in population.items()
+                        }
+                        # 4. Evolve complexes in parallel according to CCE algorithm
+                        future_list.append(
+                            executor.submit(
+                                worker._cce,
+                                complx,
+                                simplx_size,
+                                alpha,
+                                generator=generators[j],
+                            )
+                        )
+
+                    complxes: list[pd.DataFrame] = []
+                    for j, future in enumerate(future_list):
+                        complx = future.result()
+                        complxes.append(pd.concat(complx.values(), axis=1))
+                        print(
+                            f"\tCOMPLEX {j + 1}: "
+                            f"{complx['fit']['ObjectiveFunction'].max()}"
+                        )
+
+                    # 5. Shuffle complxes back together
+                    population_df = pd.concat(complxes)
+                    population_df = population_df.sort_values(
+                        "ObjectiveFunction", ascending=False
+                    )
+                    population_df = population_df.reset_index(drop=True)
+                    best_performers.append(population_df.loc[0, "ObjectiveFunction"])
+                    print(f"\tBEST: {best_performers[-1]}")
+                    print(
+                        f"\tPOPULATION MEAN: {population_df['ObjectiveFunction'].mean()}"
+                    )
+                    print(f"CYCLE {i + 1}: COMPLETED\n")
+                    # if len(best_performers) < 10:
+                    #     continue
+                    # if (best_performers[-1] / best_performers[-10]) < 1.001:
+                    #     break
 
         return {
             component: population_df[df.columns] for component, df in population.items()
@@ -93,7 +93,7 @@ class AquiModAWS:
         modules = self.module_config
 
         return {
-            component: df[
+            component: df.loc[
                 df["module_number"] == modules[component], "module_name"
             ].unique()[0]
             for component, df in df_dict.items()
@@ -104,8 +104,8 @@ class AquiModAWS:
         """Get parameter names as list value for each component key"""
         return {
             module_name: list(
-                self._model_data[
-                    self._model_data["module_name"] == module_name, "component_name"
+                self._model_data.loc[
+                    self._model_data["module_name"] == module_name, "parameter"
                 ].unique()
             )
             for module_name in self.module_names.values()
@@ -115,7 +115,7 @@ class AquiModAWS:
     def parameter_line_numbers(self) -> dict[str, int]:
         """Get parameter line numbers as a dictionary with parameter as key"""
         return {
-            parameter: self._model_data[
+            parameter: self._model_data.loc[
                 (self._model_data["module_name"] == module)
                 & (self._model_data["parameter"] == parameter),
                 "line_number",